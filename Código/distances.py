@@ -0,0 +1,184 @@
+import numpy as np
+
+
+"""
+    Armazenamento compacto da matriz de distâncias.
+
+    A matriz é guardada em um array numpy com o menor tipo inteiro sem
+    sinal capaz de representar os seus valores. Como ela é simétrica e
+    tem diagonal nula, pode ainda ser guardada apenas a parte acima da
+    diagonal, linha a linha, em um array unidimensional ('packed').
+
+    Como a factibilidade só depende de saber se uma distância é maior
+    que D, os valores podem ser saturados em D+1, o que geralmente
+    permite usar 1 byte por distância.
+"""
+
+
+def smallest_dtype(max_value):
+    """Escolhe o menor tipo inteiro sem sinal capaz de representar max_value
+
+    Args:
+        max_value (int): maior valor a ser representado
+
+    Returns:
+        dtype: tipo numpy
+    """
+
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+
+    return np.dtype(np.uint64)
+
+
+class DistanceRow:
+    """Linha i de uma DistanceMatrix, retornada por distance_matrix[i].
+       Não copia dados: distance_matrix[i][j] equivale a distance_matrix[i, j]
+       e retorna um int do Python (somas não sofrem overflow do tipo numpy).
+       Para obter a linha como array, use DistanceMatrix.row(i).
+    """
+
+    def __init__(self, matrix, i):
+        self.matrix = matrix
+        self.i = i
+
+    def __getitem__(self, j):
+        return self.matrix[self.i, j]
+
+    def __len__(self):
+        return len(self.matrix)
+
+
+class DistanceMatrix:
+    """Matriz de distâncias simétrica, acessada como distance_matrix[i, j]
+       (ou distance_matrix[i][j]), sempre com valores int do Python;
+       linhas e submatrizes podem ser obtidas como arrays numpy
+       com row() e submatrix()
+
+    Args:
+        matrix (lst/ndarray): matriz de distâncias n x n
+        packed (bool): True, para guardar apenas a parte acima da diagonal
+                       False, para guardar a matriz completa
+        saturate (int): valor máximo guardado; distâncias maiores são
+                        substituídas por ele (None para guardar os valores exatos)
+
+    A matriz recebida precisa existir inteira, então packed reduz apenas a
+    memória ocupada depois da construção. Uma matriz densa que já tenha o
+    tipo escolhido e nenhum valor acima de saturate (ex.: um np.memmap de
+    utils.read_binary_instance()) é usada diretamente, sem cópia.
+    """
+
+    def __init__(self, matrix, packed=False, saturate=None):
+        matrix = np.asarray(matrix)
+
+        self.n = len(matrix)
+        self.packed = packed
+        self.saturate = saturate
+
+        max_value = int(matrix.max()) if matrix.size else 0
+
+        # só satura (o que exige uma cópia) se algum valor passar do limite
+        self.clipped = saturate is not None and max_value > saturate
+        if self.clipped:
+            max_value = saturate
+
+        self.dtype = smallest_dtype(max_value)
+
+        if packed:
+            # a linha i ocupa as posições offsets[i] a offsets[i]+n-i-2
+            self.offsets = np.concatenate(([0], np.cumsum(np.arange(self.n-1, 0, -1)))).astype(np.int64)
+            self.data = np.empty(self.n*(self.n-1)//2, dtype=self.dtype)
+
+            for i in range(self.n-1):
+                self.data[self.offsets[i]:self.offsets[i+1]] = self.clip(matrix[i, i+1:])
+        else:
+            self.data = self.clip(matrix).astype(self.dtype, copy=False)
+
+    def clip(self, values):
+        if not self.clipped:
+            return values
+
+        return np.minimum(values, self.saturate)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            i, j = key
+
+            if not self.packed:
+                return int(self.data[i, j])
+
+            if i == j:
+                return 0
+
+            if i > j:
+                i, j = j, i
+
+            return int(self.data[self.offsets[i] + j-i-1])
+
+        return DistanceRow(self, key)
+
+    def row(self, i):
+        """Retorna a linha i da matriz
+
+        Args:
+            i (int): vértice
+
+        Returns:
+            ndarray: distâncias de i a todos os vértices
+        """
+
+        if not self.packed:
+            return self.data[i]
+
+        j = np.arange(self.n)
+
+        return self.submatrix([i], j)[0]
+
+    def submatrix(self, rows, cols=None):
+        """Retorna a submatriz com as linhas e colunas indicadas
+
+        Args:
+            rows (lst): vértices das linhas
+            cols (lst): vértices das colunas (None para usar os mesmos das linhas)
+
+        Returns:
+            ndarray: submatriz len(rows) x len(cols)
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = rows if cols is None else np.asarray(cols, dtype=np.int64)
+
+        if not self.packed:
+            return self.data[np.ix_(rows, cols)]
+
+        a = np.minimum.outer(rows, cols)
+        b = np.maximum.outer(rows, cols)
+        diagonal = a == b
+
+        pos = self.offsets[a] + b-a-1
+        pos[diagonal] = 0
+
+        sub = self.data[pos]
+        sub[diagonal] = 0
+
+        return sub
+
+    @property
+    def nbytes(self):
+        """Memória ocupada pelos dados da matriz, em bytes"""
+
+        size = self.data.nbytes
+
+        if self.packed:
+            size += self.offsets.nbytes
+
+        return size
+
+    def __repr__(self):
+        storage = 'packed' if self.packed else 'dense'
+
+        return f'DistanceMatrix(n={self.n}, dtype={self.dtype}, {storage}, saturate={self.saturate}, {self.nbytes} bytes)'
@@ -0,0 +1,171 @@
+import hashlib
+import numpy as np
+
+
+"""
+    Controle de diversidade da população.
+
+    Um mesmo particionamento pode aparecer com os clusters (e os vértices
+    de cada cluster) em ordens diferentes, ex.: [[3,6,5],[4],[1,2]] e
+    [[1,2],[5,3,6],[4]]. canonical_key() gera a mesma chave para todas
+    essas permutações, permitindo descartar clones em tempo constante.
+    canonical_hash() resume o particionamento em um digest de 128 bits, usado
+    nos caches (a chave completa ocupa memória proporcional ao número de
+    vértices, e um hash de 64 bits tornaria as colisões possíveis em execuções
+    longas). O digest é a soma dos digests dos clusters, que não depende da
+    ordem deles e permite obter o de uma mutação sem recalcular os demais
+    clusters (merge_hash()).
+
+    A distância entre dois particionamentos é a distância de Rand: a
+    fração dos pares de vértices em que os dois discordam (juntos em um
+    e separados no outro). É calculada em O(n) a partir dos vetores de
+    rótulos dos vértices.
+"""
+
+
+def canonical_key(individual):
+    """Gera uma chave que identifica o particionamento,
+       independente da ordem dos clusters e dos vértices
+
+    Args:
+        individual (lst): lista com os clusters do grafo
+
+    Returns:
+        tuple: clusters ordenados, cada um como uma tupla ordenada
+    """
+
+    return tuple(sorted(tuple(sorted(cluster)) for cluster in individual))
+
+
+# os digests são somados módulo 2^128
+HASH_MODULUS = 2**128
+
+
+def cluster_hash(cluster):
+    """Digest BLAKE2b de 128 bits de um cluster, independente da ordem dos vértices
+
+    Args:
+        cluster (lst): vértices do cluster
+
+    Returns:
+        int: digest
+    """
+
+    digest = hashlib.blake2b(repr(tuple(sorted(cluster))).encode(), digest_size=16).digest()
+
+    return int.from_bytes(digest, 'little')
+
+
+def canonical_hash(individual):
+    """Digest de 128 bits do particionamento: a soma dos digests dos
+       clusters, módulo 2^128 (os clusters são disjuntos, então dois
+       particionamentos só têm o mesmo digest por colisão)
+
+    Args:
+        individual (lst): lista com os clusters do grafo
+
+    Returns:
+        int: digest
+    """
+
+    return sum(cluster_hash(cluster) for cluster in individual) % HASH_MODULUS
+
+
+def merge_hash(key, hash1, hash2, merged):
+    """Digest do particionamento obtido ao juntar dois clusters
+
+    Args:
+        key (int): digest do particionamento original
+        hash1, hash2 (int): digests dos dois clusters
+        merged (lst): cluster resultante
+
+    Returns:
+        int: digest do novo particionamento
+    """
+
+    return (key - hash1 - hash2 + cluster_hash(merged)) % HASH_MODULUS
+
+
+def labels(individual, n_nodes):
+    """Converte o indivíduo em um vetor com o cluster de cada vértice
+
+    Args:
+        individual (lst): lista com os clusters do grafo
+        n_nodes (int): número de vértices do grafo
+
+    Returns:
+        ndarray: rótulo (índice do cluster) de cada vértice
+    """
+
+    lbl = np.empty(n_nodes, dtype=np.int64)
+
+    for c, cluster in enumerate(individual):
+        lbl[cluster] = c
+
+    return lbl
+
+
+def pairs(counts):
+    """Soma de C(x, 2) para cada x em counts"""
+
+    counts = counts.astype(np.int64)
+
+    return int((counts*(counts-1)//2).sum())
+
+
+def disagreements(labels1, labels2):
+    """Número de pares de vértices em que dois particionamentos discordam
+
+    Args:
+        labels1 (ndarray): rótulos do primeiro particionamento
+        labels2 (ndarray): rótulos do segundo particionamento
+
+    Returns:
+        int: pares juntos em um particionamento e separados no outro
+    """
+
+    # tabela de contingência entre os dois particionamentos
+    joint = np.bincount(labels1*(labels2.max()+1) + labels2)
+
+    return pairs(np.bincount(labels1)) + pairs(np.bincount(labels2)) - 2*pairs(joint)
+
+
+def partition_distance(labels1, labels2):
+    """Distância de Rand entre dois particionamentos
+
+    Args:
+        labels1 (ndarray): rótulos do primeiro particionamento
+        labels2 (ndarray): rótulos do segundo particionamento
+
+    Returns:
+        float: fração dos pares de vértices em que os particionamentos
+               discordam (0 = iguais, 1 = totalmente diferentes)
+    """
+
+    n = len(labels1)
+
+    if n < 2:
+        return 0.0
+
+    return disagreements(labels1, labels2)/(n*(n-1)//2)
+
+
+def population_diversity(population, n_nodes, reference=None):
+    """Distância média entre os indivíduos da população e um
+       indivíduo de referência
+
+    Args:
+        population (lst): lista de indivíduos
+        n_nodes (int): número de vértices do grafo
+        reference (lst): indivíduo de referência (None para usar o primeiro)
+
+    Returns:
+        float: distância de Rand média
+    """
+
+    if reference is None:
+        reference = population[0]
+
+    ref_labels = labels(reference, n_nodes)
+
+    return sum(partition_distance(ref_labels, labels(ind, n_nodes)) for ind in population)/len(population)
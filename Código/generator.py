@@ -0,0 +1,203 @@
+import distances
+import utils
+import argparse
+import numpy as np
+
+
+"""
+    Gerador de instâncias sintéticas, no mesmo formato lido por
+    utils.read_instance() (texto, '.dat') ou no formato binário
+    lido por utils.read_binary_instance() ('.bin').
+
+    O grafo gerado é sempre conexo: primeiro é criada uma árvore
+    geradora aleatória e, em seguida, são sorteadas as arestas
+    restantes até atingir a densidade pedida. A matriz de distâncias
+    é calculada pelo iGraph em lotes de linhas, que são escritos no
+    arquivo assim que calculados (a matriz nunca fica inteira em memória).
+
+    USO:
+    python generator.py 10000 --density 0.001 --D 30 --T 100 --binary
+"""
+
+
+def random_edges(n, m, rng):
+    """Sorteia m arestas distintas de um grafo conexo com n vértices
+
+    Args:
+        n (int): número de vértices
+        m (int): número de arestas (n-1 <= m <= n(n-1)/2)
+        rng (Generator): gerador de números aleatórios do numpy
+
+    Returns:
+        ndarray: matriz (m, 2) com as arestas, vértices numerados de 0 a n-1
+    """
+
+    if not n-1 <= m <= n*(n-1)//2:
+        raise ValueError(f'um grafo conexo com {n} vertices deve ter entre {n-1} e {n*(n-1)//2} arestas')
+
+    # árvore geradora: cada vértice (em ordem aleatória) se liga
+    # a um vértice sorteado entre os anteriores
+    order = rng.permutation(n)
+    parents = order[(rng.random(n-1)*np.arange(1, n)).astype(np.int64)]
+    i = np.minimum(order[1:], parents)
+    j = np.maximum(order[1:], parents)
+
+    # cada aresta (i, j), com i < j, é identificada por i*n + j
+    keys = set((i*n + j).tolist())
+
+    # sorteia as arestas restantes em lotes, descartando repetidas
+    while len(keys) < m:
+        missing = m - len(keys)
+        a = rng.integers(0, n, size=2*missing)
+        b = rng.integers(0, n, size=2*missing)
+        pairs = np.minimum(a, b)*n + np.maximum(a, b)
+
+        for key in pairs[a != b].tolist():
+            keys.add(key)
+
+            if len(keys) == m:
+                break
+
+    keys = np.sort(np.fromiter(keys, dtype=np.int64, count=m))
+
+    return np.stack((keys // n, keys % n), axis=1)
+
+
+def random_weights(m, distribution, w_min, w_max, rng):
+    """Sorteia os pesos das arestas
+
+    Args:
+        m (int): número de arestas
+        distribution (str): 'uniform'     --> uniforme entre w_min e w_max
+                            'exponential' --> exponencial a partir de w_min,
+                                              truncada em w_max
+                            'constant'    --> todos os pesos iguais a w_min
+        w_min (int): menor peso
+        w_max (int): maior peso
+        rng (Generator): gerador de números aleatórios do numpy
+
+    Returns:
+        ndarray: pesos das arestas
+    """
+
+    if distribution == 'uniform':
+        weights = rng.integers(w_min, w_max+1, size=m)
+    elif distribution == 'exponential':
+        scale = max((w_max - w_min)/4, 1)
+        weights = np.minimum(w_min + rng.exponential(scale, size=m).astype(np.int64), w_max)
+    elif distribution == 'constant':
+        weights = np.full(m, w_min)
+    else:
+        raise ValueError(f'distribuicao de pesos desconhecida: {distribution}')
+
+    return weights.astype(np.int64)
+
+
+def distance_dtype(g, w_max):
+    """Escolhe o menor tipo inteiro sem sinal capaz de representar
+       qualquer distância do grafo. O diâmetro é no máximo 2*ecc(v)
+       para qualquer vértice v, e nunca passa de (n-1)*w_max
+
+    Args:
+        g (Graph): grafo do iGraph, com o atributo 'weight'
+        w_max (int): maior peso de aresta
+
+    Returns:
+        dtype: tipo dos valores da matriz de distâncias
+    """
+
+    # excentricidade do vértice 0 (uma única linha da matriz)
+    ecc = int(max(g.distances(source=[0], weights='weight')[0]))
+
+    return distances.smallest_dtype(min(2*ecc, (g.vcount()-1)*w_max)).newbyteorder('<')
+
+
+def write_instance(file_name, n, edges, weights, D, T, binary=False, batch_size=256):
+    """Escreve a instância em disco, calculando a matriz de
+       distâncias em lotes de batch_size linhas
+
+    Args:
+        file_name (str): nome do arquivo
+        n (int): número de vértices
+        edges (ndarray): matriz (m, 2) com as arestas, vértices numerados de 0 a n-1
+        weights (ndarray): pesos das arestas
+        D (int): distância máxima entre os vértices de um subconjunto
+        T (int): número máximo de vértices em um subconjunto
+        binary (bool): True, para o formato binário
+                       False, para o formato texto
+        batch_size (int): número de linhas da matriz calculadas por vez
+    """
+
+    m = len(edges)
+
+    # arestas numeradas de 1 a n, como nas instâncias originais
+    edge_lines = np.column_stack((edges + 1, weights))
+
+    g = utils.create_graph(n, edge_lines)
+
+    if binary:
+        dtype = distance_dtype(g, int(weights.max()))
+
+        file = open(file_name, 'wb')
+        file.write(utils.binary_instance_header(n, m, D, T, dtype))
+        file.write(edge_lines.astype('<i4').tobytes())
+    else:
+        file = open(file_name, 'w')
+        file.write(f'{n} {m} {D} {T}\n')
+        np.savetxt(file, edge_lines, fmt='%d', delimiter=' ')
+
+    for start in range(0, n, batch_size):
+        rows = np.array(g.distances(source=range(start, min(start+batch_size, n)), weights='weight'))
+
+        if binary:
+            file.write(rows.astype(dtype).tobytes())
+        else:
+            np.savetxt(file, rows, fmt='%d', delimiter=' ')
+
+    file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gerador de instancias sinteticas')
+    parser.add_argument('n', type=int, help='numero de vertices')
+    parser.add_argument('--density', type=float, default=0.01, help='densidade do grafo (2m/(n(n-1)))')
+    parser.add_argument('--m', type=int, default=None, help='numero de arestas (substitui --density)')
+    parser.add_argument('--D', type=int, required=True)
+    parser.add_argument('--T', type=int, required=True)
+    parser.add_argument('--weights', default='uniform', choices=['uniform', 'exponential', 'constant'])
+    parser.add_argument('--w-min', type=int, default=1)
+    parser.add_argument('--w-max', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--binary', action='store_true', help='escreve no formato binario (.bin)')
+    parser.add_argument('--batch', type=int, default=256, help='linhas da matriz calculadas por vez')
+    parser.add_argument('--out', default=None, help='nome do arquivo (padrao: instance_n_m_D_T)')
+    args = parser.parse_args()
+
+    # pesos nulos deixariam vértices distintos à distância 0, que
+    # get_adjacency_list() e is_eligible() tratam como não adjacentes
+    if args.w_min < 1:
+        parser.error('--w-min deve ser >= 1')
+
+    if args.w_max < args.w_min:
+        parser.error('--w-max deve ser >= --w-min')
+
+    n = args.n
+    m = args.m if args.m is not None else max(n-1, round(args.density*n*(n-1)/2))
+
+    rng = np.random.default_rng(args.seed)
+
+    edges = random_edges(n, m, rng)
+    weights = random_weights(m, args.weights, args.w_min, args.w_max, rng)
+
+    file_name = args.out
+    if file_name is None:
+        ext = 'bin' if args.binary else 'dat'
+        file_name = f'problema1-instancias/instance_{n}_{m}_{args.D}_{args.T}.{ext}'
+
+    write_instance(file_name, n, edges, weights, args.D, args.T, args.binary, args.batch)
+
+    print(f'Instancia com n={n}, m={m}, D={args.D}, T={args.T} escrita em {file_name}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
+import diversity
 import utils
 import copy
 import igraph as ig
 import time
-from random import randint, choice, choices
+import random
+from random import randint, choice, choices, sample
 
 
 """
@@ -49,7 +51,7 @@ def is_eligible(individual, graph, distance_matrix, D, T):
                         if set(sp[0]) == set(v_set) and v_set not in visited:
                             #print(f'de {v_set[vertex_i]+1} ate {v_set[vertex_j]+1} o menor caminho eh {utils.inc_by_1(sp)}')
                             visited.append(v_set)
-                            d += distance_matrix[v_set[vertex_i]][v_set[vertex_j]]
+                            d += distance_matrix[v_set[vertex_i], v_set[vertex_j]]
 
             #print(len(v_set), d)
             if d > D or (len(v_set) > 1 and d == 0):
@@ -65,51 +67,132 @@ def is_eligible(individual, graph, distance_matrix, D, T):
     return eligibility
 
 
-def evaluate(individual, graph, distance_matrix, D, T):
+class FitnessCache:
+    """Cache de fitness indexado por diversity.canonical_hash()
+
+       Calcular a chave de um indivíduo exige ordenar os seus clusters;
+       para os indivíduos da população, ela é calculada uma única vez e
+       guardada com remember(). keep() descarta as chaves dos indivíduos
+       que saíram da população.
+
+    Args:
+        max_size (int): número de fitness guardados a partir do qual
+                        o cache é esvaziado (o que não altera os resultados)
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.fitness = dict()
+
+        # id(indivíduo) --> (indivíduo, chave); a referência ao
+        # indivíduo impede que o seu id seja reutilizado
+        self.keys = dict()
+
+    def key(self, individual):
+        entry = self.keys.get(id(individual))
+
+        if entry is not None:
+            return entry[1]
+
+        return diversity.canonical_hash(individual)
+
+    def remember(self, individual, key=None):
+        """Calcula (uma única vez) e retorna a chave do indivíduo"""
+
+        if key is None:
+            key = self.key(individual)
+
+        self.keys[id(individual)] = (individual, key)
+
+        return key
+
+    def keep(self, population):
+        """Mantém apenas as chaves dos indivíduos da população"""
+
+        self.keys = {id(ind): (ind, self.key(ind)) for ind in population}
+
+        if len(self.fitness) > self.max_size:
+            self.fitness.clear()
+
+
+def evaluate(individual, graph, distance_matrix, D, T, cache=None, key=None):
     """Função de avaliação de um indivíduo
 
     Args:
         individual (lst): lista com os clusters (subconjuntos) do grafo
+        cache (FitnessCache): fitness já calculados (None para não usar cache)
+        key (int): chave do indivíduo no cache, caso já seja conhecida
         others: local
 
     Returns:
         int: quantidade de clusters do grafo
     """
 
+    if cache is not None:
+        if key is None:
+            key = cache.key(individual)
+
+        if key in cache.fitness:
+            return cache.fitness[key]
+
+        # is_eligible() depende da ordem dos vértices nos clusters;
+        # avaliar a forma canônica faz o fitness depender apenas do
+        # particionamento, e não de quem entrou primeiro no cache
+        individual = [list(cluster) for cluster in diversity.canonical_key(individual)]
+
     if not is_eligible(individual, graph, distance_matrix, D, T):
         fitness = float('inf')
     else:
         fitness = len(individual)
 
+    if cache is not None:
+        cache.fitness[key] = fitness
+
     return fitness
 
 
-def tournament(participants, graph, distance_matrix, D, T):
+def tournament(participants, graph, distance_matrix, D, T, tie_break=None, cache=None):
     """Recebe uma lista com vários indivíduos e retorna o melhor deles, com relação
        a quantidade de subconjuntos do grafo
     
     Args:
         participants (lst): lista de individuos
+        tie_break (func): em caso de empate no fitness, fica com o
+                          indivíduo de maior tie_break(indivíduo)
+        cache (dict): cache de fitness, ver evaluate()
         others: local
 
     Returns:
-        lst: melhor individuo da lista recebida
+        lst, int: melhor individuo da lista recebida e o seu fitness
     """
     
     # escolhe o primeiro indivíduo da lista de participantes como o melhor
     best_individual = participants[0]
-    best_fitness = evaluate(best_individual, graph, distance_matrix, D, T)
+    best_fitness = evaluate(best_individual, graph, distance_matrix, D, T, cache)
+
+    # tie_break() do melhor indivíduo, calculado só no primeiro empate
+    best_tie = None
 
     # verifica se tem algum melhor que ele
-    for individual in participants:
-        eval_ind = evaluate(individual, graph, distance_matrix, D, T)
+    for individual in participants[1:]:
+        eval_ind = evaluate(individual, graph, distance_matrix, D, T, cache)
 
         if eval_ind < best_fitness:
             # caso tenha, atualiza o melhor indivíduo
             best_fitness = eval_ind
             best_individual = individual
+            best_tie = None
+        elif tie_break is not None and eval_ind == best_fitness:
+            if best_tie is None:
+                best_tie = tie_break(best_individual)
+
+            ind_tie = tie_break(individual)
 
-    return best_individual
+            if ind_tie > best_tie:
+                best_individual = individual
+                best_tie = ind_tie
+
+    return best_individual, best_fitness
 
 
 def crossover(parent1, parent2, adj_list):
@@ -187,13 +270,14 @@ def crossover(parent1, parent2, adj_list):
     return new_parent1, new_parent2
 
 
-def mutate(individual, m, adj_list, graph, distance_matrix, D, T):
+def mutate(individual, m, adj_list, graph, distance_matrix, D, T, cache=None):
     """Recebe um indivíduo e a probabilidade de mutação (m).
        Caso random() < m, agrupa clusters vizinhos.
 
     Args:
         individual (lst): lista com os clusters do grafo
         m (int): probabilidade de mutação
+        cache (FitnessCache): cache de fitness, ver evaluate()
         others: local
 
     Returns:
@@ -229,11 +313,24 @@ def mutate(individual, m, adj_list, graph, distance_matrix, D, T):
             #      irá procurar pelo cluster [v3, v4]
             #      em seguida, irá transformar [v1, v2] em [v1, v2, v3, v4]
             #      por fim, irá remover o antigo cluster [v3, v4]
-            best_ind = copy.deepcopy(individual)
-
             if len(mutate_pos_l) != 0:
                 best_list = list()
 
+                # cluster de cada vértice e pares de clusters já juntados;
+                # vários vizinhos levam à mesma junção, que só é gerada
+                # (e avaliada) uma vez
+                node_cluster = {node: cluster_pos for cluster_pos in range(len(individual))
+                                                  for node in individual[cluster_pos]}
+                merged = set()
+
+                # chaves das mutações no cache, obtidas a partir da chave do
+                # indivíduo e das dos dois clusters juntados
+                key_list = list()
+                cluster_keys = dict()
+
+                if cache is not None:
+                    ind_key = cache.key(individual)
+
                 i = 0
 
                 while i < len(mutate_pos_l):
@@ -242,21 +339,27 @@ def mutate(individual, m, adj_list, graph, distance_matrix, D, T):
 
                     i += 1
 
-                    found_best = False
+                    cluster_pos = node_cluster[mn_i]
 
-                    for cluster_pos in range(len(individual)):
-                        for node in individual[cluster_pos]:
-                            if node == mn_i:
-                                best_ind = copy.deepcopy(individual)
-                                best_ind[mp_i] += best_ind[cluster_pos]
-                                best_ind.pop(cluster_pos)
+                    if (mp_i, cluster_pos) in merged:
+                        continue
 
-                                best_list.append(best_ind)
-                                found_best = True
-                                break
+                    merged.add((mp_i, cluster_pos))
 
-                        if found_best:
-                            break
+                    # os clusters são listas de int, basta copiá-las
+                    best_ind = [list(cluster) for cluster in individual]
+                    best_ind[mp_i] += best_ind[cluster_pos]
+                    best_ind.pop(cluster_pos)
+
+                    best_list.append(best_ind)
+
+                    if cache is not None:
+                        for pos in (mp_i, cluster_pos):
+                            if pos not in cluster_keys:
+                                cluster_keys[pos] = diversity.cluster_hash(individual[pos])
+
+                        key_list.append(diversity.merge_hash(ind_key, cluster_keys[mp_i], cluster_keys[cluster_pos],
+                                                             individual[mp_i] + individual[cluster_pos]))
                 
                 # duas opções:
                 # escolhe indivíduo aleatório da lista de
@@ -270,19 +373,23 @@ def mutate(individual, m, adj_list, graph, distance_matrix, D, T):
                 best_ind = individual
                 best_fitness = float('inf')
 
-                for ind in best_list:
-                    current_fitness = evaluate(ind, graph, distance_matrix, D, T)
+                for j, ind in enumerate(best_list):
+                    current_fitness = evaluate(ind, graph, distance_matrix, D, T, cache,
+                                               key_list[j] if cache is not None else None)
 
                     if current_fitness < best_fitness:
                         best_ind = ind
                         best_fitness = current_fitness
 
+                        if cache is not None:
+                            cache.remember(ind, key_list[j])
+
                 individual = best_ind
     
     return individual
 
 
-def populate(n_ind, adj_list, edges_w, n_nodes, m_edges):
+def populate(n_ind, graph, n_nodes, m_edges):
     """Gera uma população com indivíduos gerados aleatoriamente
 
     Args:
@@ -294,6 +401,7 @@ def populate(n_ind, adj_list, edges_w, n_nodes, m_edges):
     """
 
     lst_individuals = list()
+    keys = set()
 
     # porcentagem do número de vértices que será
     # o limite inferior do número de subconjuntos
@@ -308,10 +416,6 @@ def populate(n_ind, adj_list, edges_w, n_nodes, m_edges):
 
     mca_nn = int(n_nodes*min_cluster_amount)
 
-    # cria o grafo com n_nodes vértices a partir de
-    # sua lista de adjacência
-    g = utils.create_graph(n_nodes, adj_list, edges_w)
-
     # itera n_ind indivíduos
     for _ in range(n_ind):
         # gera pesos aleatórios para as arestas
@@ -321,31 +425,37 @@ def populate(n_ind, adj_list, edges_w, n_nodes, m_edges):
             edges_weight.append(randint(min_edge_cost, max_edge_cost))
 
         # efetua a segmentação
-        vd = ig.Graph.community_walktrap(g, weights=edges_weight)
+        vd = ig.Graph.community_walktrap(graph, weights=edges_weight)
         vd = vd.as_clustering(randint(mca_nn, n_nodes))
         individual = utils.igraph_cluster_to_list(vd)
 
         # verifica se o indivíduo gerado já existe
         # antes de adicioná-lo à população
-        if individual not in lst_individuals:
+        key = diversity.canonical_key(individual)
+
+        if key not in keys:
+            keys.add(key)
             lst_individuals.append(individual)
 
     return lst_individuals
 
 
-def selection(participants, k, graph, distance_matrix, D, T):
+def selection(participants, k, graph, distance_matrix, D, T, cache=None):
     """Seleciona k participantes de uma população
 
     Args:
         participants (lst): população
         k (num): quantidade de participantes a selecionar
+        cache (dict): cache de fitness, ver evaluate()
         others: local
 
     Returns:
         lst: população selecionada
     """
 
-    copy_participants = copy.deepcopy(participants)
+    # os indivíduos não são alterados (crossover() e mutate() trabalham
+    # sobre cópias), então basta copiar a lista
+    copy_participants = list(participants)
 
     sel_participants = list()
     n_selected = 0
@@ -356,7 +466,7 @@ def selection(participants, k, graph, distance_matrix, D, T):
     for _ in range(k):
         selected = randint(0, len(copy_participants)-1)
 
-        if evaluate(copy_participants[selected], graph, distance_matrix, D, T) != float('inf'):
+        if evaluate(copy_participants[selected], graph, distance_matrix, D, T, cache) != float('inf'):
             # adiciona o indivíduo na lista de selecionados
             sel_participants.append(copy_participants[selected])
             n_selected += 1
@@ -376,7 +486,121 @@ def selection(participants, k, graph, distance_matrix, D, T):
     return sel_participants
 
 
-def run_ga(g, n, k, m, e, inst_file_name, debug='none'):
+def notify(observers, event, info):
+    """Chama os callbacks registrados para um evento de run_ga().
+       Cada callback recebe um dicionário com os dados do evento
+       (já calculados pelo algoritmo) e pode retornar True para
+       pedir o término da execução ao final da geração atual.
+
+       Eventos:
+       'step'           --> fim de cada cruzamento (seleção, pais, filhos)
+       'new_best'       --> fitness melhor que o da geração anterior
+       'generation_end' --> fim de cada geração
+       'phase_timing'   --> tempos acumulados de cada etapa (em segundos), ao fim de cada geração
+       'termination'    --> fim da execução, com o motivo da parada e os tempos (em segundos)
+
+    Args:
+        observers (dict): nome do evento --> lista de funções
+        event (str): nome do evento
+        info (dict): dados do evento
+
+    Returns:
+        bool: True, caso algum callback tenha pedido o término
+              False, caso contrário
+    """
+
+    stop = False
+
+    for callback in observers.get(event, ()):
+        if callback(info):
+            stop = True
+
+    return stop
+
+
+def print_step(info):
+    evaluate_ind = info['evaluate']
+
+    print('\nselecao:')
+    for i in info['selected']:
+        print(utils.inc_by_1(i), ': ', evaluate_ind(i))
+    print()
+
+    print('torneio:')
+    print('p1: ', utils.inc_by_1(info['parents'][0]), ': ', info['parents_fitness'][0])
+    print('p2: ', utils.inc_by_1(info['parents'][1]), ': ', info['parents_fitness'][1], '\n')
+
+    print('crossover:')
+    print('o1: ', utils.inc_by_1(info['crossover'][0]))
+    print('o2: ', utils.inc_by_1(info['crossover'][1]), '\n')
+
+    print('mutacao:')
+    print('o1: ', utils.inc_by_1(info['mutation'][0]))
+    print('o2: ', utils.inc_by_1(info['mutation'][1]), '\n')
+
+
+def print_generation(info):
+    print(f'Geracao {info["generation"]}: {utils.inc_by_1(info["individual"])} --> {info["fitness"]}\n')
+
+
+def print_termination(info):
+    if info['reason'] == 'stall':
+        print(f'Parou de se aprimorar na geracao {info["generation"]}\n')
+    elif info['reason'] == 'time_limit':
+        print(f'Tempo limite atingido na geracao {info["generation"]}\n')
+    elif info['reason'] == 'observer':
+        print(f'Interrompido na geracao {info["generation"]}\n')
+
+
+def print_timings(info):
+    print('Populate: {:.4f}s'.format(info['timings']['populate']))
+    print('Selection: {:.4f}s'.format(info['timings']['selection']))
+    print('Tournament: {:.4f}s'.format(info['timings']['tournament']))
+    print('Crossover: {:.4f}s'.format(info['timings']['crossover']))
+    print('Mutate: {:.4f}s'.format(info['timings']['mutate']))
+    print('\nTotal: {:.4f}s\n'.format(info['total']))
+
+
+def debug_observers(mode):
+    """Cria os observadores que imprimem o andamento do algoritmo
+
+    Args:
+        mode (str): modo debug
+                    'all'            --> mostra todos os prints
+                    'show_steps'     --> mostra somente o resultado dos passos do algoritmo
+                    'show_gen'       --> mostra somente o resultado obtido em cada geração
+                    'show_last'      --> mostra somente o resultado da última geração
+                    'show_time'      --> mostra o tempo de execução de cada etapa do algoritmo
+                    'show_gen+time'  --> show_gen e show_time
+                    'none'           --> não mostra nada
+
+    Returns:
+        dict: observadores para run_ga()
+    """
+
+    observers = dict()
+
+    if mode == 'show_steps' or mode == 'all':
+        observers['step'] = [print_step]
+
+    if mode == 'show_gen' or mode == 'show_gen+time' or mode == 'all':
+        observers['generation_end'] = [print_generation]
+
+    if mode == 'show_gen' or mode == 'show_gen+time' or mode == 'all' or mode == 'show_last':
+        observers['termination'] = [print_termination]
+
+    if mode == 'show_last':
+        observers['termination'].append(print_generation)
+
+    if mode == 'show_time' or mode == 'show_gen+time':
+        observers.setdefault('termination', list()).append(print_timings)
+
+    return observers
+
+
+def run_ga(g, n, k, m, e, inst_file_name, observers=None,
+           checkpoint_file=None, checkpoint_every=10, resume=False, warm_start=None,
+           instance=None, time_limit=None, diversity_control=True):
     """Executa o algoritmo genético e retorna o indivíduo com o menor número de clusters
     
     Args:
@@ -386,13 +610,26 @@ def run_ga(g, n, k, m, e, inst_file_name, debug='none'):
         m (float): probabilidade de mutação (entre 0 e 1, inclusive)
         e (bool): se vai haver elitismo
         inst_file_name (str): nome da instância a ser lida
-        debug (str): modo debug
-                     'all'            --> mostra todos os prints
-                     'show_steps'     --> mostra somente o resultado dos passos do algoritmo
-                     'show_gen'       --> mostra somente o resultado obtido em cada geração
-                     'show_time'      --> mostra o tempo de execução de cada etapa do algoritmo
-                     'show_gen+time'  --> show_gen e show_time
-                     'none'           --> não mostra nada
+        observers (dict): callbacks chamados a cada evento da execução
+                          (nome do evento --> lista de funções), ver notify();
+                          debug_observers() recria os antigos modos debug
+        checkpoint_file (str): arquivo onde o estado é salvo periodicamente e ao final
+                               (None para não salvar)
+        checkpoint_every (int): intervalo, em gerações, entre dois checkpoints
+        resume (bool): se True, retoma exatamente a execução salva em checkpoint_file
+        warm_start (str): checkpoint de uma execução anterior na mesma instância,
+                          cujos melhores indivíduos iniciam a população
+        instance (tuple): dados da instância já lidos por utils.read_instance()
+                          (None para ler o arquivo inst_file_name)
+        time_limit (float): tempo máximo de execução, em segundos; ao ser
+                            atingido, o algoritmo para ao final da geração atual
+        diversity_control (bool): guarda o fitness de cada particionamento já avaliado,
+                                  descarta (antes da mutação) filhos que repetem um
+                                  particionamento já presente na nova população,
+                                  ocupando as vagas com indivíduos novos, substitui o
+                                  indivíduo mais próximo quando chega um quase-clone
+                                  melhor que ele (crowding) e, no segundo torneio,
+                                  desempata pelo pai mais distante do primeiro
 
     Returns:
         lst, int, int, float: melhor indivíduo encontrado,
@@ -401,9 +638,13 @@ def run_ga(g, n, k, m, e, inst_file_name, debug='none'):
                               soma dos tempos levados pelas etapas do algoritmo genético
     """
 
+    t_run_start = time.time()
+
     # lê o arquivo da instância e coleta os dados
-    n_nodes, m_edges, D, T, distance_matrix, edges_w, graph, adj_list = \
-    utils.read_instance('problema1-instancias/' + inst_file_name, False)
+    if instance is None:
+        instance = utils.read_instance('problema1-instancias/' + inst_file_name, False, saturate=True)
+
+    n_nodes, m_edges, D, T, distance_matrix, edges_w, graph, adj_list = instance
 
     # número máximo que o mesmo fitness pode repetir
     # sem ser considerado inapto a mudar
@@ -415,144 +656,372 @@ def run_ga(g, n, k, m, e, inst_file_name, debug='none'):
     t_crossover = 0
     t_mutate = 0
 
-    # inicializa a população aleatoriamente
-    t_start = time.time()
+    # porcentagem da população inicial que pode ser ocupada
+    # pelos melhores indivíduos de uma execução anterior (warm_start)
+    warm_ratio = 0.2
+
+    # cache de fitness (um clone nunca é reavaliado), esvaziado
+    # quando passa de max_cached_fitness entradas
+    max_cached_fitness = 1000000
+    fitness_cache = FitnessCache(max_cached_fitness) if diversity_control else None
+
+    # crowding: cada filho é comparado com crowding_factor indivíduos
+    # sorteados da nova população; se ele discordar do mais próximo em
+    # no máximo crowding_pairs pares de vértices, só o melhor dos dois fica.
+    # O limite é contado em pares, e não como fração de n(n-1)/2, para
+    # ter o mesmo significado em instâncias de qualquer tamanho
+    crowding_factor = 5
+    crowding_pairs = n_nodes
+
+    # número máximo de quase-clones tratados por geração; cada um exige
+    # mais uma rodada de seleção e cruzamento, e uma população convergida
+    # produziria quase-clones indefinidamente
+    max_crowded = n//2
+
+    first_gen = 0
+
+    if observers is None:
+        observers = dict()
+
+    if resume:
+        # retoma a execução a partir do estado salvo
+        state = utils.load_checkpoint(checkpoint_file)
+
+        if state['instance'] != inst_file_name:
+            raise ValueError(f'checkpoint pertence a instancia {state["instance"]}, nao a {inst_file_name}')
+
+        p = state['population']
+        first_gen = state['n_gen']
+        n_k = state['n_k']
+        same_fitness = state['same_fitness']
+        last_best = state['last_best']
 
-    p = populate(n, adj_list, edges_w, n_nodes, m_edges)
-    n_k = int(k*len(p))
+        t_populate = state['timings']['populate']
+        t_selection = state['timings']['selection']
+        t_tournament = state['timings']['tournament']
+        t_crossover = state['timings']['crossover']
+        t_mutate = state['timings']['mutate']
 
-    t_elapsed = (time.time() - t_start)
-    t_populate += t_elapsed
+        random.setstate(state['rng_state'])
+
+        if fitness_cache is not None:
+            fitness_cache.keep(p)
+
+        best_ind, best_fitness = tournament(p, graph, distance_matrix, D, T, cache=fitness_cache)
+    else:
+        # inicializa a população aleatoriamente
+        t_start = time.time()
+
+        p = list()
+        keys = set()
+
+        if warm_start is not None:
+            state = utils.load_checkpoint(warm_start)
+
+            if state['instance'] != inst_file_name:
+                raise ValueError(f'checkpoint pertence a instancia {state["instance"]}, nao a {inst_file_name}')
+
+            # aproveita os melhores indivíduos factíveis da execução anterior
+            elite = [(evaluate(ind, graph, distance_matrix, D, T, fitness_cache), ind) for ind in state['population']]
+            elite = sorted([x for x in elite if x[0] != float('inf')], key=lambda x: x[0])
+
+            for _, ind in elite:
+                if len(p) == int(warm_ratio*n):
+                    break
+
+                if diversity.canonical_key(ind) not in keys:
+                    keys.add(diversity.canonical_key(ind))
+                    p.append(ind)
+
+        # completa a população com indivíduos aleatórios
+        for ind in populate(n-len(p), graph, n_nodes, m_edges):
+            if diversity.canonical_key(ind) not in keys:
+                keys.add(diversity.canonical_key(ind))
+                p.append(ind)
+
+        t_elapsed = (time.time() - t_start)
+        t_populate += t_elapsed
+
+        # os dois torneios de cada cruzamento precisam de participantes
+        # distintos; após descartar os repetidos, a população pode ser
+        # menor que n (ex.: grafos pequenos, com poucos particionamentos)
+        if len(p) < 2:
+            raise ValueError(f'a instancia {inst_file_name} gerou apenas {len(p)} individuo(s) distinto(s)')
+
+        n_k = max(2, int(k*len(p)))
+
+        if fitness_cache is not None:
+            fitness_cache.keep(p)
+
+        best_ind, best_fitness = tournament(p, graph, distance_matrix, D, T, cache=fitness_cache)
+        last_best = best_fitness
+        same_fitness = 0
 
-    last_best = evaluate(tournament(p, graph, distance_matrix, D, T), graph, distance_matrix, D, T)
-    same_fitness = 0
     last_gen = g
+    n_done = first_gen
+    stop_reason = 'max_gen'
 
-    if debug == 'show_steps' or debug == 'all':
-        '''print('populacao:')
-        for i in p:
-            print(utils.inc_by_1(i), end=' ')
-        print()'''
+    # melhor fitness visto até agora, usado pelo evento 'new_best'
+    # (last_best guarda apenas o da geração anterior)
+    record_fitness = best_fitness
 
     # para cada geração,
-    for n_g in range(g):
+    for n_g in range(first_gen, g):
         p_nova = []
+        p_nova_keys = set()
+        stop = False
+
+        # rótulos (diversity.labels()) dos indivíduos de p_nova,
+        # calculados apenas quando são usados pelo crowding
+        p_nova_labels = []
+        crowded = 0
+
+        # filhos descartados por repetirem um indivíduo da nova população
+        rejected = []
 
         if e:
             # se elitismo, inicializa nova população com o melhor indivíduo
             # da população anterior
-            p_nova.append(tournament(p, graph, distance_matrix, D, T))
+            p_nova.append(best_ind)
+            p_nova_labels.append(None)
+
+            if diversity_control:
+                p_nova_keys.add(fitness_cache.key(best_ind))
 
         # enquanto o número de indivíduos da população for menor que "n"
-        while len(p_nova) < n:
+        # (as vagas dos filhos descartados são preenchidas ao final)
+        while len(p_nova) + len(rejected) < n:
             t_start = time.time()
 
             # seleciona k% participantes
-            selected_participants = selection(p, n_k, graph, distance_matrix, D, T)
+            selected_participants = selection(p, n_k, graph, distance_matrix, D, T, fitness_cache)
 
             t_elapsed = (time.time() - t_start)
             t_selection += t_elapsed
 
-            if debug == 'show_steps' or debug == 'all':
-                print('\nselecao:')
-                for i in selected_participants:
-                    print(utils.inc_by_1(i), ': ', evaluate(i, graph, distance_matrix, D, T))
-                print()
-
             t_start = time.time()
 
             # executa dois torneios com os k participantes
-            p1 = tournament(selected_participants, graph, distance_matrix, D, T)
+            p1, p1_fitness = tournament(selected_participants, graph, distance_matrix, D, T, cache=fitness_cache)
 
             # para o segundo torneio, retira o valor de p1
             # que já foi selecionado
-            p_nova_linha = copy.deepcopy(selected_participants)
+            p_nova_linha = list(selected_participants)
             p_nova_linha.remove(p1)
-            p2 = tournament(p_nova_linha, graph, distance_matrix, D, T)
+
+            if diversity_control:
+                # em caso de empate, prefere o pai mais diferente de p1
+                # (tournament() calcula a distância de cada participante uma só vez)
+                p1_labels = diversity.labels(p1, n_nodes)
+                distance_p1 = lambda ind: diversity.partition_distance(p1_labels, diversity.labels(ind, n_nodes))
+
+                p2, p2_fitness = tournament(p_nova_linha, graph, distance_matrix, D, T,
+                                            tie_break=distance_p1, cache=fitness_cache)
+            else:
+                p2, p2_fitness = tournament(p_nova_linha, graph, distance_matrix, D, T)
 
             t_elapsed = (time.time() - t_start)
             t_tournament += t_elapsed
 
-            if debug == 'show_steps' or debug == 'all':
-                print('torneio:')
-                print('p1: ', utils.inc_by_1(p1), ': ', evaluate(p1, graph, distance_matrix, D, T))
-                print('p2: ', utils.inc_by_1(p2), ': ', evaluate(p2, graph, distance_matrix, D, T), '\n')
-
             t_start = time.time()
 
             # executa o crossover e obtém os dois filhos
             # ponto de cruzamento é aleatório
-            o1, o2 = crossover(p1, p2, adj_list)
+            c1, c2 = crossover(p1, p2, adj_list)
 
             t_elapsed = (time.time() - t_start)
             t_crossover += t_elapsed
 
-            if debug == 'show_steps' or debug == 'all':
-                print('crossover:')
-                print('o1: ', utils.inc_by_1(o1))
-                print('o2: ', utils.inc_by_1(o2), '\n')
-
             t_start = time.time()
 
-            # executa a mutação dos dois filhos
-            o1 = mutate(o1, m, adj_list, graph, distance_matrix, D, T)
-            o2 = mutate(o2, m, adj_list, graph, distance_matrix, D, T)
+            # executa a mutação dos dois filhos; um filho que já repete
+            # um indivíduo da nova população é descartado antes, sem
+            # avaliar as suas mutações
+            offspring = list()
+            mutated = list()
+
+            for c in (c1, c2):
+                if diversity_control and fitness_cache.remember(c) in p_nova_keys:
+                    rejected.append(c)
+                    offspring.append(c)
+                else:
+                    o = mutate(c, m, adj_list, graph, distance_matrix, D, T, fitness_cache)
+                    offspring.append(o)
+                    mutated.append(o)
+
+            o1, o2 = offspring
 
             t_elapsed = (time.time() - t_start)
             t_mutate += t_elapsed
 
-            if debug == 'show_steps' or debug == 'all':
-                print('mutacao:')
-                print('o1: ', utils.inc_by_1(o1))
-                print('o2: ', utils.inc_by_1(o2), '\n')
+            if 'step' in observers:
+                stop = notify(observers, 'step', {'generation': n_g+1,
+                                                  'selected': selected_participants,
+                                                  'parents': (p1, p2),
+                                                  'parents_fitness': (p1_fitness, p2_fitness),
+                                                  'crossover': (c1, c2),
+                                                  'mutation': (o1, o2),
+                                                  'evaluate': lambda ind: evaluate(ind, graph, distance_matrix, D, T, fitness_cache)}) or stop
+
+            # adiciona os filhos mutados na nova população,
+            # descartando os que repetem um indivíduo já presente
+            for o in mutated:
+                if diversity_control:
+                    # se o filho não sofreu mutação, a chave já é conhecida
+                    key = fitness_cache.remember(o)
+
+                    if key in p_nova_keys:
+                        rejected.append(o)
+                        continue
+
+                    # procura o indivíduo mais próximo entre alguns sorteados
+                    o_labels = diversity.labels(o, n_nodes)
+                    nearest = None
+                    nearest_pairs = None
+
+                    for i in sample(range(len(p_nova)), min(crowding_factor, len(p_nova))):
+                        if p_nova_labels[i] is None:
+                            p_nova_labels[i] = diversity.labels(p_nova[i], n_nodes)
+
+                        n_pairs = diversity.disagreements(o_labels, p_nova_labels[i])
+
+                        if nearest is None or n_pairs < nearest_pairs:
+                            nearest = i
+                            nearest_pairs = n_pairs
+
+                    if nearest is not None and nearest_pairs <= crowding_pairs and crowded < max_crowded:
+                        # quase-clone: fica o melhor dos dois
+                        crowded += 1
+
+                        if evaluate(o, graph, distance_matrix, D, T, fitness_cache) < \
+                           evaluate(p_nova[nearest], graph, distance_matrix, D, T, fitness_cache):
+                            p_nova_keys.discard(fitness_cache.key(p_nova[nearest]))
 
-            # adiciona os dois filhos na nova população
-            p_nova.append(o1)
-            p_nova.append(o2)
+                            p_nova[nearest] = o
+                            p_nova_labels[nearest] = o_labels
+                            p_nova_keys.add(key)
 
-            if debug == 'show_steps' or debug == 'all':
-                '''print('p_nova: ')
-                for i in p_nova:
-                    print(utils.inc_by_1(i), end=' ')
-                print('\n---------------------------')'''
+                        continue
+
+                    p_nova_keys.add(key)
+                    p_nova_labels.append(o_labels)
+
+                p_nova.append(o)
+
+        if rejected:
+            t_start = time.time()
+
+            # as vagas dos filhos descartados são ocupadas por indivíduos
+            # novos, em vez de novas rodadas de seleção e cruzamento
+            for ind in populate(n - len(p_nova), graph, n_nodes, m_edges):
+                key = fitness_cache.remember(ind)
+
+                if key not in p_nova_keys:
+                    p_nova_keys.add(key)
+                    p_nova.append(ind)
+
+            # em grafos pequenos pode não haver particionamentos novos
+            # suficientes; nesse caso, os próprios clones completam a população
+            p_nova += rejected[:n - len(p_nova)]
+
+            t_elapsed = (time.time() - t_start)
+            t_populate += t_elapsed
         
         # atualiza a população original com a população nova
         p = p_nova
+
+        if fitness_cache is not None:
+            fitness_cache.keep(p)
         
         # obtém o melhor indivíduo da geração
-        best_ind = tournament(p, graph, distance_matrix, D, T)
+        best_ind, best_fitness = tournament(p, graph, distance_matrix, D, T, cache=fitness_cache)
 
         last_gen = n_g+1
+        n_done = n_g+1
+        stalled = False
 
-        if evaluate(best_ind, graph, distance_matrix, D, T) == last_best:
+        if best_fitness == last_best:
             same_fitness += 1
 
-            if(same_fitness == max_fitness_repeat):
+            # '>=' para o caso de a execução ser retomada de um
+            # checkpoint salvo na geração em que ela estagnou
+            if(same_fitness >= max_fitness_repeat):
                 last_gen = n_g+1-max_fitness_repeat
-
-                if debug == 'show_gen' or debug == 'show_gen+time' or debug == 'all' or debug == 'show_last':
-                    print(f'Parou de se aprimorar na geracao {last_gen}\n')
-
-                break
+                stalled = True
         else:
-            last_best = evaluate(best_ind, graph, distance_matrix, D, T)
+            last_best = best_fitness
             same_fitness = 0
 
-        if debug == 'show_gen' or debug == 'show_gen+time' or debug == 'all' or (debug == 'show_last' and n_g == g-1):
-            print(f'Geracao {n_g+1}: {utils.inc_by_1(best_ind)} --> {evaluate(best_ind, graph, distance_matrix, D, T)}\n')
+        if best_fitness < record_fitness:
+            if 'new_best' in observers:
+                stop = notify(observers, 'new_best', {'generation': n_g+1,
+                                                      'individual': best_ind,
+                                                      'fitness': best_fitness,
+                                                      'previous_fitness': record_fitness}) or stop
+
+            record_fitness = best_fitness
+
+        if 'generation_end' in observers:
+            # distância de Rand média entre a população e o seu melhor indivíduo
+            # (0 = população convergida)
+            stop = notify(observers, 'generation_end', {'generation': n_g+1,
+                                                        'individual': best_ind,
+                                                        'fitness': best_fitness,
+                                                        'same_fitness': same_fitness,
+                                                        'population': p,
+                                                        'duplicates': len(rejected),
+                                                        'diversity': diversity.population_diversity(p, n_nodes, best_ind)}) or stop
+
+        if 'phase_timing' in observers:
+            stop = notify(observers, 'phase_timing', {'generation': n_g+1,
+                                                      'populate': t_populate,
+                                                      'selection': t_selection,
+                                                      'tournament': t_tournament,
+                                                      'crossover': t_crossover,
+                                                      'mutate': t_mutate}) or stop
+
+        if stalled:
+            stop_reason = 'stall'
+        elif stop:
+            # algum observador pediu o término
+            stop_reason = 'observer'
+        elif time_limit is not None and time.time() - t_run_start >= time_limit:
+            # o tempo máximo de execução foi atingido
+            stop_reason = 'time_limit'
+
+        if stop_reason != 'max_gen':
+            break
+
+        # salva periodicamente o estado da execução
+        # (o estado final é salvo após o laço)
+        if checkpoint_file is not None and (n_g+1) % checkpoint_every == 0 and n_g+1 < g:
+            timings = {'populate': t_populate, 'selection': t_selection, 'tournament': t_tournament,
+                       'crossover': t_crossover, 'mutate': t_mutate}
+            utils.save_checkpoint(checkpoint_file, inst_file_name, p, n_g+1, n_k, same_fitness, last_best, timings)
+
+    # salva o estado final, qualquer que seja o motivo da parada,
+    # para que a execução possa ser retomada ou usada como warm_start
+    if checkpoint_file is not None:
+        timings = {'populate': t_populate, 'selection': t_selection, 'tournament': t_tournament,
+                   'crossover': t_crossover, 'mutate': t_mutate}
+        utils.save_checkpoint(checkpoint_file, inst_file_name, p, n_done, n_k, same_fitness, last_best, timings)
 
     t_total = (t_populate + t_selection + t_tournament + t_crossover + t_mutate)/60
 
-    if debug == 'show_time' or debug == 'show_gen+time':
-        print('Populate: {:.4f}s'.format(t_populate))
-        print('Selection: {:.4f}s'.format(t_selection))
-        print('Tournament: {:.4f}s'.format(t_tournament))
-        print('Crossover: {:.4f}s'.format(t_crossover))
-        print('Mutate: {:.4f}s'.format(t_mutate))
-        print('\nTotal: {:.4f}s\n'.format(t_total))
+    if 'termination' in observers:
+        notify(observers, 'termination', {'reason': stop_reason,
+                                          'generation': last_gen,
+                                          'individual': best_ind,
+                                          'fitness': best_fitness,
+                                          'timings': {'populate': t_populate,
+                                                      'selection': t_selection,
+                                                      'tournament': t_tournament,
+                                                      'crossover': t_crossover,
+                                                      'mutate': t_mutate},
+                                          'total': t_total*60})
 
     # retorna o melhor indivíduo da última geração calculada
-    return best_ind, last_gen, evaluate(best_ind, graph, distance_matrix, D, T), t_total
+    return best_ind, last_gen, best_fitness, t_total
 
 
 def main():
@@ -602,7 +1071,7 @@ def main():
             print(f'# Instancia {fn}, Iteracao [{n_iteration+1}]')
 
             # algoritmo genético
-            res_ind, last_gen, final_fitness, time_elapsed = run_ga(n_gen, n_ind, selection_ratio, mutation_chance, elitism, fn, 'none')
+            res_ind, last_gen, final_fitness, time_elapsed = run_ga(n_gen, n_ind, selection_ratio, mutation_chance, elitism, fn)
             
             print(f'*** Geracao {last_gen}: {utils.inc_by_1(res_ind)} --> {final_fitness} ***\n')
 
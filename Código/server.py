@@ -0,0 +1,310 @@
+import genetic
+import utils
+import argparse
+import bisect
+import json
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+"""
+    Serviço local que mantém as instâncias carregadas em memória entre
+    execuções do algoritmo genético.
+
+    Cada processo trabalhador guarda um cache próprio com os dados
+    retornados por utils.read_instance() (matriz de distâncias, grafo
+    do iGraph e lista de adjacência). Quando o tamanho estimado do cache
+    ultrapassa o limite, as instâncias usadas há mais tempo são descartadas.
+
+    As requisições de uma mesma instância são sempre enviadas ao mesmo
+    processo (escolhido pelo nome da instância), de modo que cada
+    instância é carregada e guardada em um único processo.
+
+    USO:
+    python server.py --port 8080 --workers 4 --max-cache-mb 512 [--packed]
+
+    curl -X POST localhost:8080/solve -d '{"instance": "instance_20_30_20_3.dat", "n_gen": 50, "time_limit": 10}'
+"""
+
+
+# parâmetros padrão do algoritmo genético (os mesmos de genetic.main())
+DEFAULT_PARAMS = {'n_gen': 120,
+                  'n_ind': 300,
+                  'selection_ratio': 0.2,
+                  'mutation_chance': 0.25,
+                  'elitism': False,
+                  'time_limit': None,
+                  'seed': None}
+
+# diretório das instâncias (relativo a este arquivo, e não ao diretório atual)
+INSTANCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'problema1-instancias')
+
+# cache de instâncias do processo trabalhador
+# nome da instância --> (dados da instância, tamanho estimado em bytes)
+instance_cache = OrderedDict()
+cache_bytes = 0
+max_cache_bytes = 0
+packed_storage = False
+
+
+def init_worker(max_cache_mb, packed=False):
+    """Inicializa o cache de um processo trabalhador
+
+    Args:
+        max_cache_mb (int): tamanho máximo do cache, em MB
+        packed (bool): guarda apenas a parte acima da diagonal
+                       das matrizes de distâncias
+    """
+
+    global max_cache_bytes, packed_storage
+
+    max_cache_bytes = max_cache_mb*1024*1024
+    packed_storage = packed
+
+
+def instance_size(instance):
+    """Estima a memória ocupada pelos dados de uma instância
+
+    Args:
+        instance (tuple): dados retornados por utils.read_instance()
+
+    Returns:
+        int: tamanho aproximado, em bytes
+    """
+
+    n_nodes, m_edges, _, _, distance_matrix, edges_w, _, adj_list = instance
+
+    size = distance_matrix.nbytes + edges_w.nbytes
+
+    # lista de adjacência: o dicionário, as listas e os objetos int;
+    # inteiros até 256 são compartilhados pelo Python e não contam
+    int_size = sys.getsizeof(n_nodes + 257)
+    size += sys.getsizeof(adj_list)
+    for node, nbrs in adj_list.items():
+        size += sys.getsizeof(nbrs) + int_size*(len(nbrs) - bisect.bisect_right(nbrs, 256))
+
+    # grafo do iGraph: vetores de arestas e índices (int64) e a
+    # lista Python com o atributo de peso
+    size += 8*(4*m_edges + 2*(n_nodes+1)) + sys.getsizeof([0]*m_edges)
+
+    return size
+
+
+def load_cached_instance(inst_file_name):
+    """Retorna os dados de uma instância, lendo o arquivo apenas
+       se ela ainda não estiver no cache do processo
+
+    Args:
+        inst_file_name (str): nome da instância
+
+    Returns:
+        tuple, bool: dados da instância,
+                     True caso ela já estivesse no cache
+    """
+
+    global cache_bytes
+
+    if inst_file_name in instance_cache:
+        instance_cache.move_to_end(inst_file_name)
+
+        return instance_cache[inst_file_name][0], True
+
+    # as distâncias são saturadas em D+1, já que o algoritmo
+    # só precisa delas para verificar a factibilidade
+    instance = utils.read_instance(os.path.join(INSTANCES_DIR, inst_file_name), False,
+                                   packed=packed_storage, saturate=True)
+    size = instance_size(instance)
+
+    # descarta as instâncias usadas há mais tempo até
+    # que a nova instância caiba no cache
+    while instance_cache and cache_bytes + size > max_cache_bytes:
+        _, (_, old_size) = instance_cache.popitem(last=False)
+        cache_bytes -= old_size
+
+    instance_cache[inst_file_name] = (instance, size)
+    cache_bytes += size
+
+    return instance, False
+
+
+def validate_job(job):
+    """Verifica os tipos e os intervalos dos campos de uma requisição
+
+    Args:
+        job (dict): nome da instância e parâmetros do algoritmo genético
+
+    Returns:
+        str: descrição do primeiro problema encontrado (None caso não haja)
+    """
+
+    if not isinstance(job, dict):
+        return 'a requisicao deve ser um objeto JSON'
+
+    if not isinstance(job.get('instance'), str):
+        return 'campo "instance" obrigatorio (nome da instancia)'
+
+    # apenas nomes de arquivos do diretório de instâncias, sem caminhos
+    name = job['instance']
+    if os.path.basename(name) != name or not name.endswith(('.dat', '.bin')):
+        return '"instance" deve ser o nome de um arquivo .dat ou .bin do diretorio de instancias'
+
+    unknown = set(job) - set(DEFAULT_PARAMS) - {'instance'}
+
+    if unknown:
+        return f'parametros desconhecidos: {sorted(unknown)}'
+
+    params = dict(DEFAULT_PARAMS)
+    params.update(job)
+
+    # bool é subclasse de int, por isso é excluído explicitamente
+    is_int = lambda x: isinstance(x, int) and not isinstance(x, bool)
+    is_number = lambda x: isinstance(x, (int, float)) and not isinstance(x, bool)
+
+    if not is_int(params['n_gen']) or params['n_gen'] < 1:
+        return '"n_gen" deve ser um inteiro >= 1'
+
+    if not is_int(params['n_ind']) or params['n_ind'] < 2:
+        return '"n_ind" deve ser um inteiro >= 2'
+
+    if not is_number(params['selection_ratio']) or not 0 < params['selection_ratio'] <= 1:
+        return '"selection_ratio" deve estar em (0, 1]'
+
+    if not is_number(params['mutation_chance']) or not 0 <= params['mutation_chance'] <= 1:
+        return '"mutation_chance" deve estar em [0, 1]'
+
+    if not isinstance(params['elitism'], bool):
+        return '"elitism" deve ser true ou false'
+
+    if params['time_limit'] is not None and (not is_number(params['time_limit']) or params['time_limit'] <= 0):
+        return '"time_limit" deve ser um numero > 0 (ou null)'
+
+    if params['seed'] is not None and not is_int(params['seed']):
+        return '"seed" deve ser um inteiro (ou null)'
+
+    return None
+
+
+def solve_job(job):
+    """Executa o algoritmo genético para uma requisição
+
+    Args:
+        job (dict): nome da instância e parâmetros do algoritmo genético
+
+    Returns:
+        dict: resultado da execução
+    """
+
+    params = dict(DEFAULT_PARAMS)
+    params.update(job)
+
+    t_start = time.time()
+    instance, cached = load_cached_instance(params['instance'])
+    t_load = time.time() - t_start
+
+    if params['seed'] is not None:
+        random.seed(params['seed'])
+
+    res_ind, last_gen, final_fitness, time_elapsed = \
+    genetic.run_ga(params['n_gen'], params['n_ind'], params['selection_ratio'],
+                   params['mutation_chance'], params['elitism'], params['instance'],
+                   instance=instance, time_limit=params['time_limit'])
+
+    return {'instance': params['instance'],
+            'individual': utils.inc_by_1(res_ind),
+            'last_gen': last_gen,
+            'fitness': final_fitness if final_fitness != float('inf') else None,
+            'time_ga': time_elapsed*60,
+            'time_load': t_load,
+            'cached': cached}
+
+
+class SolverHandler(BaseHTTPRequestHandler):
+    """Recebe requisições POST /solve com um objeto JSON contendo
+       'instance' e, opcionalmente, os campos de DEFAULT_PARAMS
+    """
+
+    # um executor de um único processo por trabalhador
+    pools = None
+
+    def pool_for(self, inst_file_name):
+        """Escolhe o trabalhador responsável por uma instância"""
+
+        return self.pools[hash(inst_file_name) % len(self.pools)]
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != '/solve':
+            self.send_json(404, {'error': f'caminho desconhecido: {self.path}'})
+            return
+
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self.send_json(400, {'error': 'corpo da requisicao nao e um JSON valido'})
+            return
+
+        error = validate_job(job)
+
+        if error is not None:
+            self.send_json(400, {'error': error})
+            return
+
+        try:
+            result = self.pool_for(job['instance']).submit(solve_job, job).result()
+        except ValueError as err:
+            # parâmetros válidos, mas impossíveis de usar nesta instância
+            self.send_json(400, {'error': str(err)})
+            return
+        except FileNotFoundError:
+            self.send_json(404, {'error': f'instancia nao encontrada: {job["instance"]}'})
+            return
+        except Exception as err:
+            self.send_json(500, {'error': f'{type(err).__name__}: {err}'})
+            return
+
+        self.send_json(200, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='servico local do algoritmo genetico')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-cache-mb', type=int, default=512,
+                        help='limite do cache de instancias de cada processo')
+    parser.add_argument('--packed', action='store_true', help='guarda apenas metade de cada matriz de distancias')
+    args = parser.parse_args()
+
+    SolverHandler.pools = [ProcessPoolExecutor(max_workers=1, initializer=init_worker,
+                                               initargs=(args.max_cache_mb, args.packed))
+                           for _ in range(args.workers)]
+
+    server = ThreadingHTTPServer((args.host, args.port), SolverHandler)
+
+    print(f'Servindo em http://{args.host}:{args.port}/solve com {args.workers} processos')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pool in SolverHandler.pools:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import genetic
+import server
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+
+"""
+    Ajuste dos parâmetros do algoritmo genético por corrida (racing),
+    no estilo do F-race.
+
+    As configurações candidatas são avaliadas em blocos, onde cada bloco
+    é um par (instância, semente). A partir de min_blocks blocos, o teste
+    de Friedman é aplicado sobre os postos (ranks) dos fitness; caso haja
+    diferença significativa, as configurações estatisticamente piores que
+    a melhor são descartadas, e os blocos seguintes são executados apenas
+    para as sobreviventes.
+
+    Os blocos são executados em paralelo: os min_blocks primeiros são
+    submetidos de uma vez e, depois, novos blocos das sobreviventes são
+    submetidos adiantados sempre que houver trabalhadores ociosos. Os
+    testes são aplicados em ordem, à medida que cada bloco termina, e as
+    execuções adiantadas de configurações descartadas são canceladas.
+
+    As instâncias são agrupadas por classe (n, densidade, D, T) e uma
+    corrida é feita para cada classe.
+
+    LINKS:
+    https://doi.org/10.1007/978-3-642-02538-9_13   --> F-Race and Iterated F-Race: An Overview
+"""
+
+
+def instance_class(inst_file_name):
+    """Lê o cabeçalho da instância e retorna a sua classe
+
+    Args:
+        inst_file_name (str): nome da instância
+
+    Returns:
+        tuple: (n, densidade, D, T)
+    """
+
+    with open('problema1-instancias/' + inst_file_name) as file:
+        n, m, D, T = [int(x) for x in file.readline().split()]
+
+    density = round(2*m/(n*(n-1)), 2)
+
+    return n, density, D, T
+
+
+def evaluate_config(task):
+    """Executa o algoritmo genético com uma configuração candidata
+       (função executada nos processos trabalhadores)
+
+    Args:
+        task (tuple): configuração, instância, semente,
+                      número de gerações e tempo máximo
+
+    Returns:
+        float: fitness obtido (inf caso infactível)
+    """
+
+    config, inst_file_name, seed, n_gen, time_limit = task
+
+    instance, _ = server.load_cached_instance(inst_file_name)
+
+    random.seed(seed)
+
+    _, _, final_fitness, _ = genetic.run_ga(n_gen, config['n_ind'], config['selection_ratio'],
+                                            config['mutation_chance'], config['elitism'],
+                                            inst_file_name, instance=instance, time_limit=time_limit)
+
+    return final_fitness
+
+
+def rank_block(costs):
+    """Calcula os postos dos custos de um bloco (1 = menor custo),
+       usando a média dos postos em caso de empate
+
+    Args:
+        costs (lst): custos das configurações no bloco
+
+    Returns:
+        lst: posto de cada configuração
+    """
+
+    order = sorted(range(len(costs)), key=lambda i: costs[i])
+    ranks = [0]*len(costs)
+
+    i = 0
+    while i < len(order):
+        j = i
+        while j+1 < len(order) and costs[order[j+1]] == costs[order[i]]:
+            j += 1
+
+        for pos in range(i, j+1):
+            ranks[order[pos]] = (i+j)/2 + 1
+
+        i = j+1
+
+    return ranks
+
+
+def chi2_quantile(p, df):
+    """Quantil da distribuição qui-quadrado (aproximação de Wilson-Hilferty)"""
+
+    z = NormalDist().inv_cdf(p)
+
+    return df*(1 - 2/(9*df) + z*(2/(9*df))**0.5)**3
+
+
+def t_quantile(p, df):
+    """Quantil da distribuição t de Student (expansão de Cornish-Fisher)"""
+
+    z = NormalDist().inv_cdf(p)
+
+    return z + (z**3 + z)/(4*df) + (5*z**5 + 16*z**3 + 3*z)/(96*df**2)
+
+
+def friedman_survivors(results, alpha):
+    """Aplica o teste de Friedman e o teste post-hoc de Conover
+       sobre os resultados dos blocos já executados
+
+    Args:
+        results (lst): matriz [bloco][configuração] de custos
+        alpha (float): nível de significância
+
+    Returns:
+        lst: índices das configurações que não são
+             estatisticamente piores que a melhor
+    """
+
+    b = len(results)
+    k = len(results[0])
+
+    ranks = [rank_block(block) for block in results]
+    rank_sums = [sum(block[j] for block in ranks) for j in range(k)]
+
+    sum_sq = sum(r**2 for block in ranks for r in block)
+    a = sum_sq - b*k*(k+1)**2/4
+
+    # todos os blocos empatados: não há como diferenciar as configurações
+    if a == 0:
+        return list(range(k))
+
+    stat = (k-1)*sum((r - b*(k+1)/2)**2 for r in rank_sums)/a
+
+    if stat <= chi2_quantile(1-alpha, k-1):
+        return list(range(k))
+
+    best = min(rank_sums)
+
+    # diferença crítica entre somas de postos
+    df = (b-1)*(k-1)
+    crit = t_quantile(1-alpha/2, df)*(2*b*(1 - stat/(b*(k-1)))*a/df)**0.5
+
+    return [j for j in range(k) if rank_sums[j] - best <= crit]
+
+
+def race(candidates, instances, pool, n_workers, n_gen, time_limit, max_blocks, min_blocks, alpha, debug=False):
+    """Executa uma corrida entre as configurações candidatas
+
+    Args:
+        candidates (lst): lista de configurações (dicionários)
+        instances (lst): instâncias da classe
+        pool (Executor): pool de processos trabalhadores
+        n_workers (int): número de processos do pool
+        n_gen (int): número de gerações de cada execução
+        time_limit (float): tempo máximo de cada execução, em segundos
+        max_blocks (int): número máximo de blocos (orçamento da corrida)
+        min_blocks (int): número de blocos antes do primeiro teste
+        alpha (float): nível de significância
+        debug (bool): mostra as configurações descartadas
+
+    Returns:
+        dict, lst: melhor configuração,
+                   configurações sobreviventes
+    """
+
+    alive = list(range(len(candidates)))
+    results = list()
+
+    # blocos: cada semente é aplicada a todas as instâncias da classe
+    blocks = [(inst, seed) for seed in range(max_blocks) for inst in instances][:max_blocks]
+
+    # (bloco, configuração) --> execução submetida ao pool
+    futures = dict()
+    n_submitted = 0
+
+    def submit_block():
+        nonlocal n_submitted
+
+        inst, seed = blocks[n_submitted]
+
+        for c in alive:
+            futures[(n_submitted, c)] = pool.submit(evaluate_config, (candidates[c], inst, seed, n_gen, time_limit))
+
+        n_submitted += 1
+
+    # os blocos anteriores ao primeiro teste são executados de uma vez
+    while n_submitted < min(min_blocks, len(blocks)):
+        submit_block()
+
+    for n_block in range(len(blocks)):
+        # adianta os próximos blocos enquanto houver trabalhadores ociosos
+        while n_submitted < len(blocks) and sum(not f.done() for f in futures.values()) < n_workers:
+            submit_block()
+
+        # aguarda o bloco atual
+        results.append({c: futures.pop((n_block, c)).result() for c in alive})
+
+        if n_block+1 >= min_blocks and len(alive) > 1:
+            matrix = [[block[c] for c in alive] for block in results]
+            survivors = [alive[j] for j in friedman_survivors(matrix, alpha)]
+
+            if debug and len(survivors) < len(alive):
+                for c in set(alive) - set(survivors):
+                    print(f'Bloco {n_block+1}: descartada {candidates[c]}')
+
+            alive = survivors
+
+            # cancela as execuções adiantadas das configurações descartadas
+            for b, c in list(futures):
+                if c not in alive:
+                    futures.pop((b, c)).cancel()
+
+        if len(alive) == 1:
+            break
+
+    for future in futures.values():
+        future.cancel()
+
+    # escolhe, entre as sobreviventes, a de menor posto médio
+    matrix = [[block[c] for c in alive] for block in results]
+    ranks = [rank_block(block) for block in matrix]
+    mean_ranks = [sum(block[j] for block in ranks)/len(ranks) for j in range(len(alive))]
+
+    best = alive[mean_ranks.index(min(mean_ranks))]
+
+    return candidates[best], [candidates[c] for c in alive]
+
+
+def main():
+    # instâncias usadas no ajuste
+    instance_list = ['instance_6_6_4_3.dat',         'instance_20_30_20_3.dat',
+                     'instance_20_100_10_5.dat',     'instance_50_75_50_5.dat',
+                     'instance_50_750_10_5.dat',     'instance_100_350_50_10.dat',
+                     'instance_100_1000_25_15.dat',  'instance_250_3000_20_20.dat',
+                     'instance_250_7500_10_25.dat',  'instance_500_2500_50_50.dat',
+                     'instance_500_10000_15_50.dat', 'instance_1000_10000_25_50.dat',
+                     'instance_1000_50000_10_100.dat']
+
+    # valores candidatos de cada parâmetro
+    n_ind_values = [100, 300]
+    selection_ratio_values = [0.1, 0.2, 0.4]
+    mutation_chance_values = [0.1, 0.25, 0.5]
+    elitism_values = [False, True]
+
+    # parâmetros da corrida
+    n_gen = 120
+    # tempo máximo de cada execução, em segundos; sem ele, cada uma
+    # das dezenas de execuções das classes maiores roda as n_gen gerações
+    time_limit = 60
+    max_blocks = 20
+    min_blocks = 5
+    alpha = 0.05
+
+    n_workers = os.cpu_count()
+    max_cache_mb = 1024
+
+    results_filename = 'tuning_results.txt'
+
+    candidates = [{'n_ind': n_ind, 'selection_ratio': k, 'mutation_chance': m, 'elitism': e}
+                  for n_ind, k, m, e in itertools.product(n_ind_values, selection_ratio_values,
+                                                          mutation_chance_values, elitism_values)]
+
+    # agrupa as instâncias por classe
+    classes = dict()
+    for fn in instance_list:
+        classes.setdefault(instance_class(fn), list()).append(fn)
+
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=server.init_worker, initargs=(max_cache_mb,))
+
+    for inst_class, instances in classes.items():
+        n, density, D, T = inst_class
+
+        print(f'# Classe n={n}, densidade={density}, D={D}, T={T}: {len(candidates)} configuracoes')
+
+        best, survivors = race(candidates, instances, pool, n_workers, n_gen, time_limit,
+                               max_blocks, min_blocks, alpha, debug=True)
+
+        print(f'*** Recomendada: {best} ({len(survivors)} sobreviventes) ***\n')
+
+        res = open(results_filename, 'a')
+        res.write(f'n={n}, densidade={density}, D={D}, T={T} --> {best}\n')
+        res.close()
+
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,20 @@
+import distances
 import igraph as ig
 import numpy as np
+import os
+import random
+import struct
+
+
+# formato binário das instâncias:
+# cabeçalho (identificador, n, m, D, T, tipo dos valores da matriz),
+# arestas (m linhas 'i j w' em int32, vértices numerados de 1 a n)
+# e matriz de distâncias (n linhas de n valores)
+BINARY_MAGIC = b'SGP1'
+BINARY_HEADER = struct.Struct('<4s4q8s')
+
+# etapas cujos tempos acumulados são salvos nos checkpoints
+CHECKPOINT_TIMINGS = ('populate', 'selection', 'tournament', 'crossover', 'mutate')
 
 
 def inc_by_1(ind):
@@ -28,23 +43,16 @@ def get_adjacency_list(distance_matrix):
        uma matriz de distâncias entre os vértices
 
     Args:
-        distance_matrix (lst): matriz de distâncias
+        distance_matrix (DistanceMatrix): matriz de distâncias
 
     Returns:
         dict: lista de adjacência (dicionário de listas)
     """
 
-    graph_size = len(distance_matrix)
-
     adj_list = dict()
 
-    for i in range(graph_size):
-        adj_list[i] = list()
-
-    for i in range(graph_size):
-        for j in range(graph_size):
-            if distance_matrix[i][j] != 0:
-                adj_list[i].append(j)
+    for i in range(len(distance_matrix)):
+        adj_list[i] = np.flatnonzero(distance_matrix.row(i)).tolist()
 
     return adj_list
 
@@ -68,38 +76,24 @@ def igraph_cluster_to_list(d):
     return set_list
 
 
-def create_graph(n_nodes, adj_list, edges_cost):
+def create_graph(n_nodes, edges_cost):
     """Cria o grafo com n_nodes vértices a partir
-       de sua lista de adjacência
+       da sua lista de arestas
 
     Args:
         n_nodes (int): número de vértices do grafo
-        adj_list (dict): lista de adjacência do grafo
+        edges_cost (ndarray): matriz (m, 3) com as arestas do grafo, no
+                              formato (i, j, peso), com vértices numerados de 1 a n
 
     Returns:
         Graph: grafo do módulo iGraph
     """
 
-    # Referência: https://stackoverflow.com/questions/50224502/python-igraph-how-to-add-edges-with-weight
+    edges = np.asarray(edges_cost).reshape(-1, 3)
 
-    edge = list()
-    weights = list()
-
-    for i in range(len(edges_cost)):
-        for j in range(2):
-            edge.append(edges_cost[i][j])
-        weights.append(edges_cost[i][2])
-
-    edges = [(i-1, j-1) for i, j in zip(edge[::2], edge[1::2])]
-
-    edge_list = list()
-    for i in range(len(edges)):
-        edge_list.append((int(edges[i][0]), int(edges[i][1])))
-
-    g=ig.Graph()
-    g.add_vertices(n=n_nodes)
-    g.add_edges(edge_list)
-    g.es['weight'] = weights
+    # o iGraph converte pares (i, j) mais rápido que linhas de um array
+    g = ig.Graph(n=n_nodes, edges=list(zip((edges[:, 0] - 1).tolist(), (edges[:, 1] - 1).tolist())))
+    g.es['weight'] = edges[:, 2].tolist()
 
     return g
 
@@ -110,8 +104,8 @@ def generate_graph(n_nodes, distance_matrix, edges_cost, should_plot):
 
     Args:
         n_nodes (int): número de vértices do grafo
-        distance_matrix (lst): matriz de distâncias do grafo
-        edges_cost (lst): lista de tuplas contendo as arestas do grafo
+        distance_matrix (DistanceMatrix): matriz de distâncias do grafo
+        edges_cost (ndarray): matriz (m, 3) com as arestas do grafo
         should_plot (bool): True, para 'plotar' o grafo
                             False, caso contrário
 
@@ -121,7 +115,7 @@ def generate_graph(n_nodes, distance_matrix, edges_cost, should_plot):
 
     adj_list = get_adjacency_list(distance_matrix)
 
-    g = create_graph(n_nodes, adj_list, edges_cost)
+    g = create_graph(n_nodes, edges_cost)
 
     if should_plot:
         g.vs['label'] = inc_by_1(list(range(n_nodes)))
@@ -163,7 +157,7 @@ def draw_clustered_graph(g, res, n_nodes):
     ig.plot(g)
 
 
-def read_instance(file_name, should_plot):
+def read_instance(file_name, should_plot, packed=False, saturate=False):
     """Lê o arquivo de uma instância do problema e
        coleta os dados necessários para resolver o
        problema. São eles:
@@ -171,14 +165,27 @@ def read_instance(file_name, should_plot):
        m -> número de arestas
        D -> distância máxima entre os vértices de um subconjunto
        T -> número máximo de vértices em um subconjunto
+       Arquivos com extensão '.bin' são lidos por read_binary_instance()
 
     Args:
         file_name (str): nome do arquivo
+        packed (bool): guarda apenas a parte acima da diagonal
+                       da matriz de distâncias (ver DistanceMatrix)
+        saturate (bool): satura as distâncias em D+1, suficiente
+                         para verificar a factibilidade
+
+    O arquivo texto é lido inteiro em um array int64 antes de a matriz ser
+    convertida para o tipo compacto, então o pico de memória na leitura é de
+    cerca de 8*n^2 bytes, com ou sem packed. Para instâncias grandes, use o
+    formato binário, cuja matriz é mapeada do arquivo (np.memmap).
 
     Returns:
-        int, int, int, int, lst, lst: dados coletados
+        int, int, int, int, DistanceMatrix, ndarray: dados coletados
     """
 
+    if file_name.endswith('.bin'):
+        return read_binary_instance(file_name, should_plot, packed, saturate)
+
     # abre o arquivo
     file = open(file_name)
 
@@ -186,24 +193,185 @@ def read_instance(file_name, should_plot):
     n, m, D, T = file.readline().split()
     n, m, D, T = int(n), int(m), int(D), int(T)
 
-    # lê os pesos das arestas do grafo
-    costs = list()
+    # lê as arestas (i, j, peso) e a matriz de distâncias do grafo
+    values = np.fromstring(file.read(), dtype=np.int64, sep=' ')
 
-    for _ in range(m):
-        line = file.readline().split()
-        costs_vec = list()
+    file.close()
 
-        for i in range(3):
-            costs_vec.append(int(line[i]))
+    edges = values[:3*m].reshape(m, 3).astype(np.int32)
+    matrix = values[3*m:].reshape(n, n)
+    distance_matrix = distances.DistanceMatrix(matrix, packed, D+1 if saturate else None)
 
-        costs.append(costs_vec)
-        
-    # lê a matriz de distâncias do grafo
-    distance_matrix = [[int(num) for num in line.split(' ')] for line in file]
-    cost_tuples = [tuple(l) for l in costs]
+    graph, adj_list = generate_graph(n, distance_matrix, edges, should_plot)
 
-    file.close()
+    return n, m, D, T, distance_matrix, edges, graph, adj_list
+
+
+def binary_instance_header(n, m, D, T, dtype):
+    """Gera o cabeçalho de uma instância no formato binário
+
+    Args:
+        n, m, D, T (int): dados da instância
+        dtype (dtype): tipo dos valores da matriz de distâncias
+
+    Returns:
+        bytes: cabeçalho
+    """
+
+    return BINARY_HEADER.pack(BINARY_MAGIC, n, m, D, T, np.dtype(dtype).str.encode())
+
+
+def read_binary_instance(file_name, should_plot, packed=False, saturate=False):
+    """Lê uma instância no formato binário (ver BINARY_HEADER).
+       Retorna os mesmos dados que read_instance().
+
+    Args:
+        file_name (str): nome do arquivo
+        packed, saturate (bool): ver read_instance()
+
+    Returns:
+        int, int, int, int, DistanceMatrix, ndarray: dados coletados
+    """
+
+    with open(file_name, 'rb') as file:
+        magic, n, m, D, T, dtype = BINARY_HEADER.unpack(file.read(BINARY_HEADER.size))
+
+    if magic != BINARY_MAGIC:
+        raise ValueError(f'{file_name} nao e uma instancia no formato binario')
+
+    dtype = np.dtype(dtype.rstrip(b'\0').decode())
+
+    edges = np.memmap(file_name, dtype='<i4', mode='r', offset=BINARY_HEADER.size, shape=(m, 3))
+    matrix = np.memmap(file_name, dtype=dtype, mode='r',
+                       offset=BINARY_HEADER.size + edges.nbytes, shape=(n, n))
+
+    distance_matrix = distances.DistanceMatrix(matrix, packed, D+1 if saturate else None)
+    edges = np.array(edges, dtype=np.int32)
+
+    graph, adj_list = generate_graph(n, distance_matrix, edges, should_plot)
+
+    return n, m, D, T, distance_matrix, edges, graph, adj_list
+
+
+def encode_population(population):
+    """Codifica a população em três arrays de inteiros, preservando
+       a ordem dos clusters e dos vértices de cada indivíduo
+       (necessário para que a retomada seja exata)
+
+    Args:
+        population (lst): lista de indivíduos
+
+    Returns:
+        ndarray, ndarray, ndarray: número de clusters de cada indivíduo,
+                                   tamanho de cada cluster,
+                                   vértices de todos os clusters concatenados
+    """
+
+    n_clusters = np.array([len(ind) for ind in population], dtype=np.int32)
+    sizes = np.array([len(cluster) for ind in population for cluster in ind], dtype=np.int32)
+    nodes = np.array([v for ind in population for cluster in ind for v in cluster], dtype=np.int32)
+
+    return n_clusters, sizes, nodes
+
+
+def decode_population(n_clusters, sizes, nodes):
+    """Operação inversa de encode_population()
+
+    Args:
+        n_clusters (ndarray): número de clusters de cada indivíduo
+        sizes (ndarray): tamanho de cada cluster
+        nodes (ndarray): vértices de todos os clusters concatenados
+
+    Returns:
+        lst: lista de indivíduos
+    """
+
+    population = list()
+    sizes = sizes.tolist()
+    nodes = nodes.tolist()
+
+    c_pos = 0
+    v_pos = 0
+
+    for n_c in n_clusters.tolist():
+        individual = list()
+
+        for size in sizes[c_pos:c_pos+n_c]:
+            individual.append(nodes[v_pos:v_pos+size])
+            v_pos += size
+
+        c_pos += n_c
+        population.append(individual)
+
+    return population
+
+
+def save_checkpoint(file_name, inst_file_name, population, n_gen, n_k, same_fitness, last_best, timings):
+    """Salva em disco (arquivo .npz, apenas arrays numéricos) o estado do
+       algoritmo genético ao final de uma geração. O arquivo é escrito
+       primeiro em um arquivo temporário e depois renomeado, para que uma
+       interrupção durante a escrita não corrompa o checkpoint anterior.
+
+    Args:
+        file_name (str): nome do arquivo de checkpoint
+        inst_file_name (str): nome da instância sendo resolvida
+        population (lst): população atual
+        n_gen (int): número de gerações já calculadas
+        n_k (int): número de participantes de cada seleção
+        same_fitness (int): contador de gerações sem melhoria
+        last_best (int): fitness do melhor indivíduo até então
+        timings (dict): tempos acumulados de cada etapa
+    """
+
+    n_clusters, sizes, nodes = encode_population(population)
+
+    # estado do gerador do módulo random: (versão, 625 inteiros, gauss_next)
+    rng_version, rng_internal, rng_gauss = random.getstate()
+
+    tmp_name = file_name + '.tmp'
+
+    with open(tmp_name, 'wb') as file:
+        np.savez(file,
+                 instance=np.array(inst_file_name),
+                 n_gen=np.int64(n_gen),
+                 n_k=np.int64(n_k),
+                 same_fitness=np.int64(same_fitness),
+                 last_best=np.float64(last_best),
+                 timings=np.array([timings[t] for t in CHECKPOINT_TIMINGS], dtype=np.float64),
+                 rng_version=np.int64(rng_version),
+                 rng_internal=np.array(rng_internal, dtype=np.uint64),
+                 rng_gauss=np.float64(np.nan if rng_gauss is None else rng_gauss),
+                 n_clusters=n_clusters,
+                 sizes=sizes,
+                 nodes=nodes)
+
+    os.replace(tmp_name, file_name)
+
+
+def load_checkpoint(file_name):
+    """Lê um checkpoint salvo por save_checkpoint()
+
+    Args:
+        file_name (str): nome do arquivo de checkpoint
+
+    Returns:
+        dict: estado salvo, com a população já decodificada na chave 'population'
+    """
+
+    with np.load(file_name, allow_pickle=False) as file:
+        last_best = float(file['last_best'])
+        rng_gauss = float(file['rng_gauss'])
+
+        data = {'instance': str(file['instance']),
+                'n_gen': int(file['n_gen']),
+                'n_k': int(file['n_k']),
+                'same_fitness': int(file['same_fitness']),
+                'last_best': int(last_best) if last_best != float('inf') else last_best,
+                'timings': dict(zip(CHECKPOINT_TIMINGS, file['timings'].tolist())),
+                'rng_state': (int(file['rng_version']),
+                              tuple(file['rng_internal'].tolist()),
+                              None if np.isnan(rng_gauss) else rng_gauss),
+                'population': decode_population(file['n_clusters'], file['sizes'], file['nodes'])}
 
-    graph, adj_list = generate_graph(n, distance_matrix, cost_tuples, should_plot)
+    return data
 
-    return n, m, D, T, distance_matrix, cost_tuples, graph, adj_list
\ No newline at end of file